@@ -1,72 +1,155 @@
 import os
 import glob
+import re
 import xarray as xr
-import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from collections import defaultdict
+
+
+# first YYYYMMDD token in a file name is its date
+DATE_RE = re.compile(r"\d{8}")
+
+
+def _files_by_date(input_dir):
+    """
+    List input_dir once and bucket the netCDF files by date string.
+    """
+    by_date = defaultdict(list)
+    for file_path in sorted(glob.glob(os.path.join(input_dir, "*.nc"))):
+        match = DATE_RE.search(os.path.basename(file_path))
+        if match:
+            by_date[match.group()].append(file_path)
+    return by_date
+
+
+def _select_files(by_date, current_date):
+    """
+    Files of the day plus the last file of the previous day and the first of the next.
+    """
+    prev_day_files = by_date.get((current_date - timedelta(days=1)).strftime("%Y%m%d"), [])
+    next_day_files = by_date.get((current_date + timedelta(days=1)).strftime("%Y%m%d"), [])
+
+    selected_files = list(by_date.get(current_date.strftime("%Y%m%d"), []))
+    if prev_day_files:
+        selected_files.insert(0, prev_day_files[-1])
+    if next_day_files:
+        selected_files.append(next_day_files[0])
+    return selected_files
+
+
+# target size of one written chunk, within the 1-20 MB range that suits HDF5
+CHUNK_BYTES = 4 * 1024**2
+
+# source encoding keys describing storage layout, compression or bookkeeping, not the data itself
+LAYOUT_ENCODING_KEYS = {
+    "chunksizes", "contiguous", "original_shape", "source", "preferred_chunks",
+    "zlib", "complevel", "shuffle", "fletcher32", "compression",
+    "szip_coding", "szip_pixels_per_block", "blosc_shuffle",
+}
+
+
+def _chunks_for(da, itemsize):
+    """
+    Chunk shape for writing: about CHUNK_BYTES of time steps by the full extent of the other dims.
+    """
+    other_size = int(np.prod([size for dim, size in zip(da.dims, da.shape) if dim != "time"]))
+    time_chunk = max(1, CHUNK_BYTES // (itemsize * max(other_size, 1)))
+    return tuple(
+        min(time_chunk, size) if dim == "time" else size
+        for dim, size in zip(da.dims, da.shape)
+    )
 
 
-# this function need to be broken in to smaller functions
-def process_files(args):
-
-    input_dir= args.input
-    output_dir= args.output
+def _process_one_day(current_date, selected_files, output_dir, prefix):
+    """
+    Write one daily file. Runs in a worker process, so returns (log level, message) for the parent to log.
+    """
+    try:
+        date_str = current_date.strftime("%Y%m%d")
 
-    # Convert to datetime
-    current_date = datetime.strptime(args.start, "%Y-%m-%d")
-    end_date = datetime.strptime(args.end, "%Y-%m-%d")
-
-    while current_date <= end_date:
-        try:
-            prev_date_str = (current_date - timedelta(days=1)).strftime("%Y%m%d")
-            date_str = current_date.strftime("%Y%m%d")
-            next_date_str = (current_date + timedelta(days=1)).strftime("%Y%m%d")
-
-            time_units = f"seconds since {date_str} 00:00:00"
-            encoding = {
-                "time": {
-                    "units": time_units,
-                    "calendar": "standard",
-                    "dtype": "float64",
-                }
+        time_units = f"seconds since {date_str} 00:00:00"
+        encoding = {
+            "time": {
+                "units": time_units,
+                "calendar": "standard",
+                "dtype": "float64",
             }
+        }
+
+        if selected_files:
+            # open the files concurrently; non-time variables are taken from the first file
+            daily_ds = xr.open_mfdataset(
+                selected_files,
+                concat_dim="time",
+                combine="nested",
+                parallel=True,
+                data_vars="minimal",
+                coords="minimal",
+                compat="override",
+            )
+            daily_ds = daily_ds.sortby("time")
+
+            start_of_day = np.datetime64(current_date.date(), "ns")
+            end_of_day = start_of_day + np.timedelta64(1, "D")
+            daily_ds = daily_ds.sel(
+                time=slice(start_of_day, end_of_day - np.timedelta64(1, "ms"))
+            )
+
+            # compressed, time-chunked layout; profiles are read as blocks of time
+            for var in daily_ds.data_vars:
+                da = daily_ds[var]
+                if da.dtype.kind not in "fiu":
+                    continue
+                # keep the source encoding (dtype, fill/missing values, packing), replace only the layout
+                encoding[var] = {
+                    key: value for key, value in da.encoding.items() if key not in LAYOUT_ENCODING_KEYS
+                }
+                encoding[var].update({"zlib": True, "complevel": 1})
+                if "time" in da.dims and 0 not in da.shape:
+                    itemsize = np.dtype(encoding[var].get("dtype", da.dtype)).itemsize
+                    encoding[var]["chunksizes"] = _chunks_for(da, itemsize)
+
+            output_path = os.path.join(output_dir, f"{prefix}{date_str}-000000.nc")
+            daily_ds.to_netcdf(output_path, encoding=encoding)
+            daily_ds.close()
+            return logging.INFO, f"Done for {date_str} --> {output_path}"
+        else:
+            return logging.WARNING, f"No files for day {date_str}"
+    except Exception as e:
+        return logging.ERROR, f"Error processing day {current_date:%Y%m%d}: {e}"
+
+
+def process_files(start, end, input_dir, output_dir, prefix="crocus-neiu-ceil-a1-", workers=2):
+    """
+    Make one daily file in output_dir for each day from start to end (YYYY-MM-DD, inclusive).
+    Each worker holds about one day of profiles in memory, so peak memory grows with workers.
+    """
+    os.makedirs(output_dir, exist_ok=True)
 
-            prev_files_pattern = os.path.join(input_dir, f"*{prev_date_str}*.nc")
-            current_files_pattern = os.path.join(input_dir, f"*{date_str}*.nc")
-            next_files_pattern = os.path.join(input_dir, f"*{next_date_str}*.nc")
-
-            prev_day_files = sorted(glob.glob(prev_files_pattern))
-            current_day_files = sorted(glob.glob(current_files_pattern))
-            next_day_files = sorted(glob.glob(next_files_pattern))
-
-            selected_files = current_day_files
-            if prev_day_files:
-                selected_files.insert(0, prev_day_files[-1])
-            if next_day_files:
-                selected_files.append(next_day_files[0])
-
-            if selected_files:
-                daily_ds = xr.open_mfdataset(selected_files, concat_dim='time', combine='nested')
-                daily_ds = daily_ds.sortby("time")
-
-                start_of_day = pd.to_datetime(date_str).floor("D")
-                end_of_day = start_of_day + timedelta(days=1)
-                daily_ds = daily_ds.sel(
-                    time=slice(start_of_day, end_of_day - pd.to_timedelta("1ms"))
-                )
-
-                output_path = os.path.join(output_dir, f"{args.prefix}{date_str}-000000.nc")
-                daily_ds.to_netcdf(output_path, encoding=encoding)
-                logging.info(f"Done for {date_str} --> {output_path}")
-
-                daily_ds.close()
-            else:
-                logging.warning(f"No files for day {date_str}")
-        except Exception as e:
-            logging.error(f"Error processing day {date_str}: {e}")
-
-        current_date += timedelta(days=1)
+    # Convert to datetime
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    end_date = datetime.strptime(end, "%Y-%m-%d")
+
+    # days are independent (own inputs, own output file), so run them in separate processes
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    by_date = _files_by_date(input_dir)
+    day_files = [_select_files(by_date, d) for d in dates]
+    one_day = partial(_process_one_day, output_dir=output_dir, prefix=prefix)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(one_day, d, f) for d, f in zip(dates, day_files)]
+        for current_date, future in zip(dates, futures):
+            try:
+                level, message = future.result()
+            except BrokenProcessPool as e:
+                # a worker died (e.g. killed for memory); the pool cannot run the remaining days
+                level, message = logging.ERROR, f"Error processing day {current_date:%Y%m%d}: {e}"
+            logging.log(level, message)
 
 
 if __name__ == "__main__":
@@ -76,6 +159,7 @@ if __name__ == "__main__":
     parser.add_argument("--input", help="Directory.", required=True)
     parser.add_argument("--output", help="Directory.", required=True)
     parser.add_argument("--prefix", help="Output filename prefix, added before datetime string. (Default: crocus-neiu-ceil-a1-)", default="crocus-neiu-ceil-a1-")
+    parser.add_argument("--workers", type=int, help="Number of days processed in parallel, each holding about one day of data in memory. (Default: 2)", default=2)
 
     args = parser.parse_args()
 
@@ -96,4 +180,4 @@ if __name__ == "__main__":
 
   
 
-    process_files(args)
+    process_files(args.start, args.end, args.input, args.output, prefix=args.prefix, workers=args.workers)
@@ -5,6 +5,7 @@
 import os
 import shutil
 import datetime 
+import numpy as np
 from netCDF4 import Dataset, num2date
 
 import glob
@@ -14,6 +15,10 @@ import argparse
 import logging
 
 
+# date-time stamp in Vaisala file names, e.g. 20240101_000000
+NAME_DT_RE = re.compile(r'\d{8}_\d{6}')
+
+
 def get_modification_time(file_path, latency):
     try:
         mod_time_epoch = os.path.getmtime(file_path) - latency
@@ -22,10 +27,10 @@ def get_modification_time(file_path, latency):
         logging.error(f"Error getting modification time for {file_path}: {e}")
         return None
 
-def new_file_name(original_file_path, mod_time):
+def new_file_name(original_file_path, mod_time, output_dir):
     base_name = os.path.basename(original_file_path)
     new_date_time = mod_time.strftime('%Y%m%d_%H%M%S')
-    new_base_name = re.sub(r'\d{8}_\d{6}', new_date_time, base_name)
+    new_base_name = NAME_DT_RE.sub(new_date_time, base_name, count=1)
     return os.path.join(output_dir, new_base_name)
 
 
@@ -35,20 +40,24 @@ def adjust_time_variable(time_var, mod_time, midnight):
     Use file modification time.
     """
     try:
-        times = num2date(time_var[:], units=time_var.units)  # Convert num times to pyhton datetime objects
+        units = time_var.units
+        raw = np.asarray(time_var[:], dtype=np.float64)
         # in this version we are getting interval from the file (No assumptions).
-        delta_seconds = [(t - times[0]).total_seconds() for t in times]  
+        if units.startswith("seconds since"):
+            delta_seconds = raw - raw[0]  # units are overwritten below, no need to decode
+        else:
+            times = num2date(raw, units=units,
+                             only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+            times = np.asarray(times, dtype="datetime64[us]")  # one numpy array instead of python datetimes
+            delta_seconds = (times - times[0]) / np.timedelta64(1, "s")
         mod_time = mod_time.replace(tzinfo=None)
 
         # This end of the last observations time should be align the file's modification time.  
         # i am using delta_Seconds because vaisla files last observation time is not same as file name.
-        total_interval = (times[-1] - times[0]).total_seconds()
-        #time_interval = datetime.timedelta(seconds=delta_seconds[0])
+        total_interval = delta_seconds[-1]
         seconds_since_midnight = (mod_time - midnight).total_seconds() - total_interval
 
-        adjusted_times = [seconds_since_midnight + delta for delta in delta_seconds] 
-        
-        time_var[:] = adjusted_times  # change nc time to new times
+        time_var[:] = seconds_since_midnight + delta_seconds  # change nc time to new times
         time_var.units = f'seconds since {midnight.strftime("%Y-%m-%d 00:00:00")}'
     except Exception as e:
         logging.error(f"Error adjusting time variable: {e}")
@@ -80,14 +89,14 @@ def adjust_time_axis(nc_file, mod_time):
 
 #
 
-def process_file(original_file_path, latency):
+def process_file(original_file_path, output_dir, latency):
     mod_time = get_modification_time(original_file_path, latency)
     if mod_time is None:
         return
     
-    new_file_path = new_file_name(original_file_path, mod_time)
+    new_file_path = new_file_name(original_file_path, mod_time, output_dir)
     try:
-        shutil.copy(original_file_path, new_file_path)
+        shutil.copyfile(original_file_path, new_file_path)  # data only, no permission bits
         with Dataset(new_file_path, 'r+') as nc_file:
             adjust_time_axis(nc_file, mod_time)
         logging.info(f'Processed {original_file_path} ---> {new_file_path}')
@@ -95,6 +104,15 @@ def process_file(original_file_path, latency):
         logging.error(f"Error processing file {original_file_path}: {e}")
 
 
+def main(input_dir, output_dir, pattern="*.nc", latency=0):
+    """
+    Adjust time of all files matching pattern in input_dir and write them to output_dir.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for file_path in glob.glob(os.path.join(input_dir, pattern)):
+        process_file(file_path, output_dir, latency=latency)
+
+
 # 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ingest Ceil files.")
@@ -107,9 +125,8 @@ if __name__ == "__main__":
     input_dir = args.i
     output_dir = args.o
 
-    # Ensure the output directory exists
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    # Ensure the output directory exists (for the log file)
+    os.makedirs(output_dir, exist_ok=True)
 
 
     # create logfile
@@ -125,5 +142,4 @@ if __name__ == "__main__":
     logging.info(f"Script arguments: {vars(args)}")  # args in namespce not dict
 
 
-    for file_path in glob.glob(os.path.join(input_dir, args.p)):
-        process_file(file_path, latency=args.l)
\ No newline at end of file
+    main(input_dir, output_dir, pattern=args.p, latency=args.l)